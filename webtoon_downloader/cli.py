@@ -1,6 +1,6 @@
 import logging
 from pathlib import Path
-from typing import Optional
+from typing import Annotated, Optional
 
 from rich.console import Console
 from rich.logging import RichHandler
@@ -14,9 +14,10 @@ app = Typer()
 @app.callback(context_settings={"obj": {}})
 def callback(
     ctx: Context,
-    verbose: int = Option(  # noqa: B008
-        1, "-v", "--verbose", min=1, max=4, clamp=True, count=True
-    ),
+    verbose: Annotated[
+        int,
+        Option("-v", "--verbose", min=1, max=4, clamp=True, count=True),
+    ] = 1,
 ):
     console = Console(stderr=True)
     handler = RichHandler(console=console)
@@ -44,27 +45,32 @@ def _ensure_directory(path: Path) -> Path:
 @app.command()
 def download(
     ctx: Context,
-    url: str = Option(..., help="URL to webtoon to download"),  # noqa: B008
-    destination: Path = Option(  # noqa: B008
-        Path(".").resolve().expanduser(),  # noqa: B008
-        "-d",
-        "--dest",
-        "--destination",
-        help="Parent folder for downloads",
-        callback=_ensure_directory,
-    ),
-    start: int = Option(  # noqa: B008
-        None, help="Chapter to start downloading from"
-    ),
-    end: Optional[int] = Option(  # noqa: B008
-        None, help="Last chapter to download"
-    ),
-    latest: bool = Option(  # noqa: B008
-        False, help="Only download latest chapter"
-    ),
-    compress: bool = Option(  # noqa: B008
-        True, help="Compress chapters to .cbz after downloading"
-    ),
+    url: Annotated[str, Option(help="URL to webtoon to download")],
+    # resolved by the callback, so nothing touches the filesystem for --help
+    destination: Annotated[
+        Path,
+        Option(
+            "-d",
+            "--dest",
+            "--destination",
+            help="Parent folder for downloads",
+            callback=_ensure_directory,
+            default_factory=lambda: Path("."),
+            show_default=".",
+        ),
+    ],
+    start: Annotated[
+        Optional[int], Option(help="Chapter to start downloading from")
+    ] = None,
+    end: Annotated[
+        Optional[int], Option(help="Last chapter to download")
+    ] = None,
+    latest: Annotated[
+        bool, Option(help="Only download latest chapter")
+    ] = False,
+    compress: Annotated[
+        bool, Option(help="Compress chapters to .cbz after downloading")
+    ] = True,
 ):
     if latest and (start is not None or end is not None):
         raise BadParameter(
@@ -4,7 +4,7 @@ from typing import List
 from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
 
 
-@dataclass(eq=True, repr=True)
+@dataclass(eq=True, repr=True, slots=True)
 class SeriesInfo:
     title: str
     description: str
@@ -23,7 +23,7 @@ class SeriesInfo:
         self.image = urlunparse(u)
 
 
-@dataclass(eq=True, repr=True)
+@dataclass(eq=True, repr=True, slots=True)
 class ChapterInfo:
     #: chapter title
     title: str
@@ -34,21 +34,11 @@ class ChapterInfo:
     #: viewer URL
     content_url: str
 
-    def __lt__(self, o: object) -> bool:
-        if not isinstance(o, ChapterInfo):
-            raise TypeError("Must compare with ChapterInfo")
-        return self.data_episode_no < o.data_episode_no
 
-
-@dataclass(eq=True, repr=True)
+@dataclass(eq=True, repr=True, slots=True)
 class PageInfo:
     number: int
     width: int
     height: int
     url: str
     size: int
-
-    def __lt__(self, o: object) -> bool:
-        if not isinstance(o, PageInfo):
-            raise TypeError("Must compare with PageInfo")
-        return self.number < o.number
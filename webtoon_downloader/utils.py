@@ -2,10 +2,16 @@ import concurrent.futures
 import logging
 import math
 import os
+import re
+import shutil
+import threading
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
+from functools import cache
+from operator import attrgetter
 from pathlib import Path
-from typing import List, Optional, Set
-from urllib import request
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
 from urllib.parse import (
     parse_qs,
     parse_qsl,
@@ -14,14 +20,18 @@ from urllib.parse import (
     urlparse,
     urlunparse,
 )
-from zipfile import ZipFile
+from zipfile import ZIP_STORED, ZipFile
 
+import httpx
+import lxml.html
 import requests
-import requests.adapters
-from bs4 import BeautifulSoup, Tag
 from lxml import etree
+from lxml.builder import E
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession, SQLiteCache
 from rich.console import Console
 from rich.progress import MofNCompleteColumn, Progress, TaskID
+from urllib3.util.retry import Retry
 
 from webtoon_downloader.content_info import ChapterInfo, PageInfo, SeriesInfo
 
@@ -45,6 +55,151 @@ HEADERS = {
 }
 IMAGE_HEADERS = {"referer": "https://www.webtoons.com/", **HEADERS}
 
+_DATE_RE = re.compile(r"(\w{3}) (\d{1,2}), (\d{4})")
+_MONTHS = {
+    "Jan": 1,
+    "Feb": 2,
+    "Mar": 3,
+    "Apr": 4,
+    "May": 5,
+    "Jun": 6,
+    "Jul": 7,
+    "Aug": 8,
+    "Sep": 9,
+    "Oct": 10,
+    "Nov": 11,
+    "Dec": 12,
+}
+
+
+def _has_class(name: str) -> str:
+    """
+    XPath predicate matching elements with :param:`name` as one of their
+    classes, the same way BeautifulSoup and CSS selectors match ``class``
+    """
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+_OPENGRAPH_XPATH = etree.XPath("//meta[@property=$property]/@content")
+_GENRE_XPATH = etree.XPath(f"//h2[{_has_class('genre')}]")
+_CHAPTER_XPATH = etree.XPath("//li[@data-episode-no]")
+# smart_strings=False makes these return plain ``str``s rather than results
+# that keep a reference back to the tree
+_DATE_XPATH = etree.XPath(
+    f"string(.//span[{_has_class('date')}])", smart_strings=False
+)
+_SUBJ_XPATH = etree.XPath(
+    f"string(.//span[{_has_class('subj')}])", smart_strings=False
+)
+_HREF_XPATH = etree.XPath("string(.//a/@href)", smart_strings=False)
+_PAGINATION_XPATH = etree.XPath(f"//div[{_has_class('paginate')}]//a")
+_CURRENT_PAGE_XPATH = etree.XPath(
+    f"//div[{_has_class('paginate')}]//a[@href='#']"
+)
+_IMAGE_XPATH = etree.XPath("//div[@id='_imageList']/img")
+#: chunk size used when streaming response bodies to disk
+COPY_BUFSIZE = 64 * 1024
+#: upper bound on in-flight requests to any single host. :data:`EXECUTOR`
+#: has this many workers, so in practice it only holds back requests made
+#: from the main and chapter threads on top of those
+MAX_REQUESTS_PER_HOST = 32
+
+#: chapters downloaded at once; each one fans its images out to
+#: :data:`EXECUTOR`
+MAX_CONCURRENT_CHAPTERS = 4
+#: shared by every chapter for fetching pages and images, sized so that its
+#: workers alone can't exceed :data:`MAX_REQUESTS_PER_HOST`
+EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=MAX_REQUESTS_PER_HOST
+)
+
+_host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_host_semaphores_lock = threading.Lock()
+
+
+@contextmanager
+def _host_slot(url: str) -> Iterator[None]:
+    """Blocks until a request slot for the host of :param:`url` is free"""
+    host = urlparse(url).netloc
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(
+                MAX_REQUESTS_PER_HOST
+            )
+        semaphore = _host_semaphores[host]
+    with semaphore:
+        yield
+
+
+@cache
+def _session() -> CachedSession:
+    """
+    Returns the session shared by every request made by the downloader. It
+    is created on first use, so importing this module stays cheap.
+
+    Pages are cached and revalidated with conditional requests, so re-runs
+    mostly get 304s. The cache lives in memory until :func:`use_cache_at`
+    points it somewhere persistent. Images go through :func:`_image_client`,
+    so they never reach the cache.
+    """
+    session = CachedSession(
+        backend="memory",
+        cache_control=True,
+        expire_after=3600,
+        allowable_methods=("GET",),
+        urls_expire_after={
+            "*webtoons.com/*/viewer*": 60,
+            "*webtoons.com/*/list*": 300,
+        },
+    )
+    # one pool per host, each large enough that concurrent downloads never
+    # force urllib3 to discard keep-alive connections
+    adapter = HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=256,
+        pool_block=False,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+        ),
+    )
+    session.mount("http://", adapter=adapter)
+    session.mount("https://", adapter=adapter)
+    session.headers.update(HEADERS)
+    session.cookies.set("needGDPR", "FALSE", domain=".webtoons.com")
+    session.cookies.set("needCCPA", "FALSE", domain=".webtoons.com")
+    session.cookies.set("needCOPPA", "FALSE", domain=".webtoons.com")
+    return session
+
+
+@cache
+def _image_client() -> httpx.Client:
+    """
+    Returns the client used for image downloads, created on first use.
+    Images come from a CDN that speaks HTTP/2, so one client multiplexes
+    every image download over a handful of connections.
+    """
+    return httpx.Client(
+        headers=IMAGE_HEADERS,
+        timeout=httpx.Timeout(30.0),
+        follow_redirects=True,
+        transport=httpx.HTTPTransport(
+            http2=True,
+            retries=3,
+            limits=httpx.Limits(max_connections=MAX_REQUESTS_PER_HOST),
+        ),
+    )
+
+
+def use_cache_at(cache_name: Path):
+    """Persists :func:`_session`'s cache to an SQLite database"""
+    session = _session()
+    # the settings live on the cache object, so carry them over to the new one
+    settings = session.settings
+    session.cache = SQLiteCache(cache_name)
+    session.settings = settings
+
 
 def pop_query_param(url: str, key: str) -> str:
     u = urlparse(url)
@@ -54,181 +209,202 @@ def pop_query_param(url: str, key: str) -> str:
     return urlunparse(u)
 
 
-def parse_meta_from_series(soup: BeautifulSoup) -> SeriesInfo:
+def _canonicalize_url(base: str, href: str) -> str:
+    """
+    Resolves :param:`href` against :param:`base` and normalizes it so links
+    to the same page compare equal: query parameters are sorted, blank ones
+    are dropped, and so is the fragment
+    """
+    u = urlparse(urljoin(base, href))
+    q = sorted(parse_qsl(u.query))
+    return urlunparse(u._replace(query=urlencode(q), fragment=""))
+
+
+def parse_meta_from_series(tree: lxml.html.HtmlElement) -> SeriesInfo:
     """Parses opengraph and other meta tags for series info"""
     opengraph_keys = ["title", "url", "image", "description"]
     series_info = {}
     for key in opengraph_keys:
-        for opengraph_entry in soup.find_all("meta", property=f"og:{key}"):
-            series_info[key] = opengraph_entry["content"]
+        for content in _OPENGRAPH_XPATH(tree, property=f"og:{key}"):
+            series_info[key] = str(content)
 
-    author_soup = soup.find("meta", property="com-linewebtoon:webtoon:author")
-    if isinstance(author_soup, Tag):
-        series_info["author"] = author_soup["content"]
+    for content in _OPENGRAPH_XPATH(
+        tree, property="com-linewebtoon:webtoon:author"
+    ):
+        series_info["author"] = str(content)
 
-    series_info["genre"] = [
-        g.text for g in soup.find_all("h2", {"class": "genre"})
-    ]
+    series_info["genre"] = [g.text_content() for g in _GENRE_XPATH(tree)]
 
     return SeriesInfo(**series_info)
 
 
-def get_chapters_on_page(soup: BeautifulSoup) -> List[ChapterInfo]:
+def _parse_date(date: str) -> datetime:
+    """
+    Parses dates like ``Jan 2, 2020``. Equivalent to ``strptime`` with
+    ``%b %d, %Y``, minus the per-call format parsing and locale lookups
+    """
+    m = _DATE_RE.fullmatch(date.strip())
+    # %b is case-insensitive, so normalize before looking the month up
+    if not m or (month := m[1].title()) not in _MONTHS:
+        raise ValueError(f"Unable to parse {date=}")
+    return datetime(int(m[3]), _MONTHS[month], int(m[2]))
+
+
+def get_chapters_on_page(tree: lxml.html.HtmlElement) -> List[ChapterInfo]:
     """Gets the chapters on a page"""
     chapters: List[ChapterInfo] = []
-    for chapter_entry in soup.find_all("li", attrs={"data-episode-no": True}):
-        date = chapter_entry.find("span", attrs={"class": "date"}).text
-        date_format = "%b %d, %Y"
+    for chapter_entry in _CHAPTER_XPATH(tree):
+        date = _DATE_XPATH(chapter_entry)
         chapters.append(
             ChapterInfo(
-                title=chapter_entry.find("span", attrs={"class": "subj"}).text,
-                data_episode_no=int(chapter_entry["data-episode-no"]),
-                date_released=datetime.strptime(date, date_format),
-                content_url=str(chapter_entry.find("a")["href"]),
+                title=_SUBJ_XPATH(chapter_entry),
+                data_episode_no=int(chapter_entry.get("data-episode-no")),
+                date_released=_parse_date(date),
+                content_url=_HREF_XPATH(chapter_entry),
             )
         )
     return chapters
 
 
-def get_all_chapter_sets(
-    url: str,
-    session: requests.Session,
-    soup: BeautifulSoup,
-    progress: Progress,
-    task_id: TaskID,
-    _size: int = 0,
-) -> Set[str]:
+def _current_chapter_set(url: str, tree: lxml.html.HtmlElement) -> str:
     """
-    Handles paginating through all the chapter sets (e.g., that page that shows
-    ~10 chapters)
+    Gets the URL of the chapter set being viewed in :param:`tree`. Its
+    pagination entry links to `#`, so the URL is rebuilt from the series URL
+    and the page number. Returns :param:`url` if there is no pagination.
     """
-    urls = set()
-    if pagination_div := soup.find("div", attrs={"class": "paginate"}):
-        logger.info("Found pagination, fetching more chapters/sections")
-        if not isinstance(pagination_div, Tag):
-            logger.exception(
-                "Unable to paginate for more chapters, returning what we have"
-            )
-            return urls
-
-        pagination_div_a_s = pagination_div.find_all("a")
-        _size += len(pagination_div_a_s)
-        progress.update(
-            task_id=task_id,
-            total=_size,
-            refresh=True,
+    for page in _CURRENT_PAGE_XPATH(tree):
+        urlparse_res = urlparse(url)
+        qs = dict(parse_qsl(urlparse_res.query))
+        qs["page"] = page.text_content().strip()
+        return _canonicalize_url(
+            url, urlunparse(urlparse_res._replace(query=urlencode(qs)))
         )
-        for page in pagination_div_a_s:
-            if page.text == "Next Page":
-                # add the URL of the next page here, because once you index to
-                # the next set of pages, you won't have this URL anymore (it'll
-                # just be `#`)
-                urls.add(page["href"])
-                # this is O(N) to the number of pages and we can't parallelize
-                # because we don't know how many pages there'll be
-                more_soup = _get_soup_without_special_headers(
-                    urljoin(url, page["href"]), session=session
-                )
-                urls = urls.union(
-                    get_all_chapter_sets(
-                        url=url,
-                        session=session,
-                        soup=more_soup,
-                        progress=progress,
-                        task_id=task_id,
-                        _size=_size,
-                    )
-                )
-            elif page["href"] == "#":
-                # for some reason, the condition above and below no longer get
-                # the first page, but this will, so
-                urlparse_res = urlparse(url)
-                qs = dict(parse_qsl(urlparse_res.query))
-                qs["page"] = page.text
-                _url = urlunparse(
-                    [
-                        urlparse_res.scheme,
-                        urlparse_res.netloc,
-                        urlparse_res.path,
-                        urlparse_res.params,
-                        urlencode(qs),
-                        urlparse_res.fragment,
-                    ]
-                )
-                # need to ensure it exists
-                if request.urlopen(_url).status == 200:
-                    # this one will be the full URL instead of just everything
-                    # after netloc due to the fact we're too lazy to remove
-                    # scheme and netloc from this string. it resolved above
-                    # anyways, so it's probably ok.
-                    urls.add(_url)
-                continue
-            else:
-                progress.update(task_id=task_id, advance=1, refresh=True)
-                urls.add(page["href"])
+    return _canonicalize_url(url, url)
+
+
+def get_all_chapter_sets(
+    url: str, tree: lxml.html.HtmlElement
+) -> Tuple[Set[str], List[ChapterInfo]]:
+    """
+    Collects the URLs of every chapter set (e.g., that page that shows ~10
+    chapters) linked from the pagination on :param:`tree`, along with the
+    chapters on :param:`tree` itself. Does not fetch anything; callers walk
+    the returned URLs to discover more.
+    """
+    urls: Set[str] = set()
+    for page in _PAGINATION_XPATH(tree):
+        href = page.get("href")
+        if href == "#":
+            urls.add(_current_chapter_set(url=url, tree=tree))
+        elif href:
+            # includes "Next Page", which links to the first page of the
+            # next set of pages
+            urls.add(_canonicalize_url(url, href))
 
-    return urls
+    return urls, get_chapters_on_page(tree)
 
 
-def _get_soup_without_special_headers(
-    url: str, session: requests.Session
-) -> BeautifulSoup:
-    return BeautifulSoup(session.get(url, headers=HEADERS).text, "lxml")
+def _get_html(url: str, session: requests.Session) -> lxml.html.HtmlElement:
+    with _host_slot(url):
+        content = session.get(url).content
+    return lxml.html.fromstring(content)
 
 
 def get_chapters_in_series(
     url: str,
     session: requests.Session,
-    soup: BeautifulSoup,
+    tree: lxml.html.HtmlElement,
     console: Console,
+    executor: concurrent.futures.Executor = EXECUTOR,
 ) -> List[ChapterInfo]:
     """
     Gets all the chapters in a series. Automatically paginates if necessary.
+
+    The number of chapter sets isn't known up front, so they're walked
+    breadth-first: every known chapter set is fetched in parallel, and each
+    response may link to chapter sets that haven't been seen yet.
     """
 
-    chapters = []
-    # TODO: optimize - we fetch 1, 11, 21, ..., twice
-    with Progress(console=console, transient=True) as progress:
-        task_id = progress.add_task("Fetch chapter list")
-        chapter_sets = get_all_chapter_sets(
-            url=url,
-            session=session,
-            soup=soup,
-            progress=progress,
-            task_id=task_id,
-        )
+    visited, chapters = get_all_chapter_sets(url=url, tree=tree)
+    if visited:
+        logger.info("Found pagination, fetching more chapters/sections")
+    # :param:`tree` is the chapter set at :param:`url`; don't fetch it again
+    # when another chapter set links back to it
+    fetched = {
+        _canonicalize_url(url, url),
+        _current_chapter_set(url=url, tree=tree),
+    }
+    visited |= fetched
 
-    with Progress(
-        console=console, transient=True
-    ) as progress, concurrent.futures.ThreadPoolExecutor() as executor:
-        chapter_set_futures = []
+    with Progress(console=console, transient=True) as progress:
         task_id = progress.add_task("Fetching chapter metadata")
-        for chapter_set in chapter_sets:
-            u = urljoin(url, chapter_set)
-            future = executor.submit(
-                _get_soup_without_special_headers, url=u, session=session
+
+        def _submit(chapter_set: str) -> concurrent.futures.Future:
+            return executor.submit(
+                _get_html,
+                url=chapter_set,
+                session=session,
             )
-            chapter_set_futures.append(future)
-        for future in concurrent.futures.as_completed(chapter_set_futures):
-            res = future.result()
-            progress.update(
-                task_id=task_id, total=len(chapters) + len(res), refresh=True
+
+        pending = {_submit(chapter_set) for chapter_set in visited - fetched}
+        progress.update(
+            task_id=task_id, total=len(visited - fetched) + 1, advance=1
+        )
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
             )
-            chapters.extend(get_chapters_on_page(res))
-            progress.update(task_id=task_id, advance=len(res), refresh=True)
+            for future in done:
+                res = future.result()
+                chapter_sets, more_chapters = get_all_chapter_sets(
+                    url=url, tree=res
+                )
+                chapters.extend(more_chapters)
+                unseen = chapter_sets - visited
+                visited |= unseen
+                pending |= {_submit(chapter_set) for chapter_set in unseen}
+                progress.update(
+                    task_id=task_id,
+                    total=len(visited - fetched) + 1,
+                    advance=1,
+                )
 
-    return sorted(chapters)
+    return sorted(chapters, key=attrgetter("data_episode_no"))
+
+
+def _zero_padded_format(largest: int) -> str:
+    """
+    Builds a format string that zero pads numbers up to :param:`largest` to
+    the same width, so filenames sort in order
+    """
+    return f"{{:0{len(str(largest))}}}"
 
 
 def download_image(
-    session: requests.Session,
+    client: httpx.Client,
     image: PageInfo,
     chapter_directory: Path,
-    zero_padding: int,
+    filename_format: str,
+    archive: Optional[ZipFile] = None,
+    archive_lock: Optional[threading.Lock] = None,
+    copies: Sequence[PageInfo] = (),
 ):
-    """Downloads an image. Updates the :param:`image` size as necessary"""
-    image_response = session.get(image.url, headers=IMAGE_HEADERS, stream=True)
-    if image_response.status_code == 200:
+    """
+    Downloads an image. Updates the :param:`image` size as necessary. If
+    :param:`archive` is given, the image only goes into it, added while
+    holding :param:`archive_lock`; otherwise it's saved in
+    :param:`chapter_directory`. It's also saved as each of :param:`copies`,
+    pages that share its URL.
+    """
+    # the connection stays checked out until the body has been read, so hold
+    # the slot for the whole transfer
+    with (
+        _host_slot(image.url),
+        client.stream("GET", image.url) as image_response,
+    ):
+        if image_response.status_code != 200:
+            logger.exception(f"Could not retrieve {image.url}")
+            return
         filetype = image_response.headers.get("content-type")
         if filetype == "image/jpeg":
             suffix = ".jpg"
@@ -236,20 +412,54 @@ def download_image(
             suffix = ".png"
         else:
             raise Exception(f"Unable to handle {filetype=}")
-        Path(
-            chapter_directory, f"{image.number:0{zero_padding}}{suffix}"
-        ).write_bytes(image_response.content)
-        # update the size
-        image.size = len(image_response.content)
-    else:
-        logger.exception(f"Could not retrieve {image.url}")
+        names = [
+            filename_format.format(page.number) + suffix
+            for page in (image, *copies)
+        ]
+        if archive is None:
+            # stream straight to disk instead of buffering the whole image
+            path = Path(chapter_directory, names[0])
+            with path.open("wb") as f:
+                for chunk in image_response.iter_bytes(COPY_BUFSIZE):
+                    f.write(chunk)
+            for name in names[1:]:
+                shutil.copyfile(path, Path(chapter_directory, name))
+            size = path.stat().st_size
+        else:
+            # the archive is the only copy, so skip the disk entirely
+            content = image_response.read()
+            with archive_lock or nullcontext():
+                for name in names:
+                    archive.writestr(name, content)
+            size = len(content)
+    # update the size
+    for page in (image, *copies):
+        page.size = size
+
+
+@contextmanager
+def _partial_archive(path: Path) -> Iterator[ZipFile]:
+    """
+    Opens a .cbz that only appears at :param:`path` once it's complete. It's
+    written to a ``.part`` file that's renamed into place on success and
+    removed on failure, so an interrupted chapter never looks finished
+    """
+    partial_path = Path(str(path) + ".part")
+    try:
+        # images are already compressed, so store them in the .cbz as-is
+        with ZipFile(
+            partial_path, mode="w", compression=ZIP_STORED, allowZip64=True
+        ) as archive:
+            yield archive
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        raise
+    os.replace(partial_path, path)
 
 
 def compute_comicinfo_xml(
     series_info: SeriesInfo, chapter_info: ChapterInfo, pages: List[PageInfo]
 ) -> etree._Element:
-    comic_info = etree.Element("ComicInfo", attrib=None, nsmap=None)
-
     # handle the root elements
     etree_to_text_mapping = {
         "Title": chapter_info.title,
@@ -266,29 +476,23 @@ def compute_comicinfo_xml(
         "Manga": "No",
         "Web": chapter_info.content_url,
     }
-    for k, v in etree_to_text_mapping.items():
-        elem = etree.Element(k, attrib=None, nsmap=None)
-        elem.text = str(v)
-        comic_info.append(elem)
-
-    # and then handle the pages
-    page_array = etree.Element("Pages", attrib=None, nsmap=None)
-    for page in pages:
-        page_element = etree.Element(
-            "Page",
-            attrib={
-                "Image": str(page.number),
-                "Type": "FrontCover" if page.number == 0 else "Story",
-                "ImageSize": str(page.size),
-                "ImageWidth": str(page.width),
-                "ImageHeight": str(page.height),
-            },
-            nsmap=None,
-        )
-        page_array.append(page_element)
-    comic_info.append(page_array)
 
-    return comic_info
+    return E.ComicInfo(
+        *[getattr(E, k)(str(v)) for k, v in etree_to_text_mapping.items()],
+        # and then handle the pages
+        E.Pages(
+            *[
+                E.Page(
+                    Image=str(page.number),
+                    Type="FrontCover" if page.number == 0 else "Story",
+                    ImageSize=str(page.size),
+                    ImageWidth=str(page.width),
+                    ImageHeight=str(page.height),
+                )
+                for page in pages
+            ]
+        ),
+    )
 
 
 def download_chapter(
@@ -296,79 +500,120 @@ def download_chapter(
     series_info: SeriesInfo,
     session: requests.Session,
     series_directory: Path,
-    chapter_zero_padding: int,
+    chapter_format: str,
     task_id: TaskID,
     progress: Progress,
     compress: bool = False,
+    executor: concurrent.futures.Executor = EXECUTOR,
+    viewer: Optional[concurrent.futures.Future] = None,
+    client: Optional[httpx.Client] = None,
 ):
-    # create the directory for the chapter images
+    """
+    Downloads a chapter. :param:`viewer` may hold the chapter's already
+    requested viewer page, otherwise it is fetched here. Images are fetched
+    with :param:`client`, or :func:`_image_client` if it isn't given.
+    """
+    if client is None:
+        client = _image_client()
+
     chapter_directory = Path(
-        series_directory, f"{chapter.data_episode_no:0{chapter_zero_padding}}"
+        series_directory, chapter_format.format(chapter.data_episode_no)
     )
-    chapter_directory.mkdir(parents=True, exist_ok=True)
 
     # request the viewer URL so we can get the list of images
-    soup = _get_soup_without_special_headers(
-        chapter.content_url, session=session
-    )
+    if viewer is None:
+        tree = _get_html(chapter.content_url, session=session)
+    else:
+        tree = viewer.result()
 
     # extract images
-    image_container = soup.find("div", attrs={"id": "_imageList"})
-    if not image_container or not isinstance(image_container, Tag):
+    images = _IMAGE_XPATH(tree)
+    if not images:
         raise Exception(
             f"Unable to download chapter {chapter.data_episode_no}"
         )
 
-    images = image_container.find_all("img", recursive=False)
     # pad zeroes to filename as necessary
-    zero_padding = math.ceil(math.log10(len(images))) + 1
+    filename_format = _zero_padded_format(len(images) - 1)
 
-    progress.update(
-        task_id=task_id, total=len(images), visible=True, refresh=True
-    )
+    progress.update(task_id=task_id, total=len(images), visible=True)
     progress.start_task(task_id=task_id)
 
     pages: List[PageInfo] = [
         PageInfo(
             number=image_idx,
-            width=math.ceil(float(image["width"])),
-            height=math.ceil(float(image["height"])),
-            url=image["data-url"],
+            width=math.ceil(float(image.get("width"))),
+            height=math.ceil(float(image.get("height"))),
+            url=image.get("data-url"),
             size=0,
         )
         for image_idx, image in enumerate(images)
     ]
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
+    if not compress:
+        # create the directory for the chapter images
+        chapter_directory.mkdir(parents=True, exist_ok=True)
+    archive_lock = threading.Lock()
+
+    with (
+        _partial_archive(Path(str(chapter_directory) + ".cbz"))
+        if compress
+        else nullcontext()
+    ) as archive:
+        # some chapters repeat an image (e.g., banners), so only fetch each
+        # URL once and save it for every page that uses it
+        url_pages: Dict[str, List[PageInfo]] = {}
         for page_info in pages:
-            future = executor.submit(
+            url_pages.setdefault(page_info.url, []).append(page_info)
+        future_to_pages = {
+            executor.submit(
                 download_image,
-                session=session,
-                image=page_info,
+                client,
+                same_url_pages[0],
                 chapter_directory=chapter_directory,
-                zero_padding=zero_padding,
-            )
-            future.add_done_callback(
-                lambda _: progress.update(
-                    task_id=task_id, advance=1, refresh=True
+                filename_format=filename_format,
+                archive=archive,
+                archive_lock=archive_lock,
+                copies=same_url_pages[1:],
+            ): same_url_pages
+            for same_url_pages in url_pages.values()
+        }
+
+        # drains every image before moving on, since ComicInfo.xml needs
+        # their sizes and the archive can't close while images are still
+        # being written
+        for future in concurrent.futures.as_completed(future_to_pages):
+            same_url_pages = future_to_pages[future]
+            if error := future.exception():
+                logger.error(
+                    f"Could not download {same_url_pages[0].url} for chapter "
+                    f"{chapter.data_episode_no}: {error!r}"
                 )
+            progress.advance(task_id, len(same_url_pages))
+
+        # a page is only sized once it's saved, so this also catches images
+        # that came back with a non-200 status
+        if missing := [page.number for page in pages if page.size == 0]:
+            raise Exception(
+                f"Chapter {chapter.data_episode_no} is missing pages {missing}"
             )
 
-    # compute ComicInfo.xml
-    comic_info = compute_comicinfo_xml(
-        series_info=series_info, chapter_info=chapter, pages=pages
-    )
-    Path(chapter_directory, "ComicInfo.xml").write_text(
-        etree.tostring(
-            comic_info, pretty_print=True, encoding=str  # type: ignore
+        # compute ComicInfo.xml
+        comic_info = compute_comicinfo_xml(
+            series_info=series_info, chapter_info=chapter, pages=pages
         )
-    )
-
-    if compress:
-        chapter_cbz = Path(str(chapter_directory) + ".cbz")
-        with ZipFile(chapter_cbz, mode="w") as zipfile:
-            for i in chapter_directory.iterdir():
-                zipfile.write(i, i.name)
+        comic_info_xml = etree.tostring(
+            comic_info,
+            pretty_print=True,
+            encoding="utf-8",
+            xml_declaration=True,
+        )
+        if archive is None:
+            Path(chapter_directory, "ComicInfo.xml").write_bytes(
+                comic_info_xml
+            )
+        else:
+            archive.writestr("ComicInfo.xml", comic_info_xml)
 
 
 def series_downloader(
@@ -382,17 +627,14 @@ def series_downloader(
 ):
     """Downloads a series"""
 
-    session = requests.session()
-    # multithreading performance should be improved here
-    adapter = requests.adapters.HTTPAdapter(pool_maxsize=100)
-    session.mount("https://", adapter=adapter)
-    session.cookies.set("needGDPR", "FALSE", domain=".webtoons.com")
-    session.cookies.set("needCCPA", "FALSE", domain=".webtoons.com")
-    session.cookies.set("needCOPPA", "FALSE", domain=".webtoons.com")
-
-    soup = _get_soup_without_special_headers(url=url, session=session)
+    use_cache_at(Path(destination, ".wtd_cache"))
+    session = _session()
+    # created here, before any chapter thread starts, so every chapter shares
+    # the one client instead of racing to create their own
+    client = _image_client()
+    tree = _get_html(url=url, session=session)
 
-    series_info = parse_meta_from_series(soup=soup)
+    series_info = parse_meta_from_series(tree=tree)
     logger.debug(series_info)
 
     series_directory = Path(destination, series_info.title)
@@ -401,33 +643,80 @@ def series_downloader(
     logger.info(f"Series downloading to: {series_directory}")
 
     chapters = get_chapters_in_series(
-        url=url, session=session, soup=soup, console=console
+        url=url, session=session, tree=tree, console=console
     )
 
-    chapter_zero_padding = math.ceil(math.log10(len(chapters))) + 1
+    chapter_format = _zero_padded_format(chapters[-1].data_episode_no)
 
     if download_latest_chapter:
         chapters = [chapters[-1]]
-    else:
-        start = start or 0
-        end = end or chapters[-1].data_episode_no
-        chapters = list(
-            filter(
-                lambda chapter: chapter.data_episode_no >= start
-                and chapter.data_episode_no <= end,
-                chapters,
-            )
+    elif start is not None or end is not None:
+        # chapters are sorted by episode number, so binary search the range
+        episode_no = attrgetter("data_episode_no")
+        lo = (
+            0
+            if start is None
+            else bisect_left(chapters, start, key=episode_no)
         )
-
-    with Progress(
-        *Progress.get_default_columns(),
-        MofNCompleteColumn(),
-        transient=True,
-        console=console,
-    ) as progress, concurrent.futures.ThreadPoolExecutor() as executor:
+        hi = (
+            len(chapters)
+            if end is None
+            else bisect_right(chapters, end, key=episode_no)
+        )
+        chapters = chapters[lo:hi]
+
+    with (
+        Progress(
+            *Progress.get_default_columns(),
+            MofNCompleteColumn(),
+            transient=True,
+            console=console,
+        ) as progress,
+        concurrent.futures.ThreadPoolExecutor(
+            max_workers=MAX_CONCURRENT_CHAPTERS
+        ) as executor,
+    ):
         try:
             future_to_task_id_mapping = {}
-            for chapter in chapters:
+            future_to_chapter_mapping = {}
+
+            def _finish(future: concurrent.futures.Future):
+                task_id = future_to_task_id_mapping.pop(future)
+                progress.update(task_id=task_id, visible=False)
+                chapter = future_to_chapter_mapping.pop(future)
+                if error := future.exception():
+                    logger.error(
+                        "Could not download chapter "
+                        f"{chapter.data_episode_no}: {error!r}",
+                        exc_info=error,
+                    )
+
+            viewer: Optional[concurrent.futures.Future] = None
+            for chapter_idx, chapter in enumerate(chapters):
+                if len(future_to_task_id_mapping) >= MAX_CONCURRENT_CHAPTERS:
+                    # only queue up more work once a chapter is done, so the
+                    # viewer prefetched below stays one chapter ahead
+                    done, _ = concurrent.futures.wait(
+                        future_to_task_id_mapping,
+                        return_when=concurrent.futures.FIRST_COMPLETED,
+                    )
+                    for future in done:
+                        _finish(future)
+
+                if viewer is None:
+                    viewer = EXECUTOR.submit(
+                        _get_html, chapter.content_url, session=session
+                    )
+                # fetch the next chapter's viewer while this chapter's images
+                # download
+                next_viewer = None
+                if chapter_idx + 1 < len(chapters):
+                    next_viewer = EXECUTOR.submit(
+                        _get_html,
+                        chapters[chapter_idx + 1].content_url,
+                        session=session,
+                    )
+
                 task_id = progress.add_task(
                     description=f"Download chapter {chapter.data_episode_no}",
                     start=False,
@@ -438,18 +727,21 @@ def series_downloader(
                     session=session,
                     series_info=series_info,
                     series_directory=series_directory,
-                    chapter_zero_padding=chapter_zero_padding,
+                    chapter_format=chapter_format,
                     chapter=chapter,
                     task_id=task_id,
                     progress=progress,
                     compress=compress,
+                    viewer=viewer,
+                    client=client,
                 )
                 future_to_task_id_mapping[future] = task_id
+                future_to_chapter_mapping[future] = chapter
+                viewer = next_viewer
             for future in concurrent.futures.as_completed(
                 future_to_task_id_mapping
             ):
-                task_id = future_to_task_id_mapping[future]
-                progress.update(task_id=task_id, visible=False, refresh=True)
+                _finish(future)
         except KeyboardInterrupt:
             logger.exception("Received SIGINT, letting work drain/complete")
             executor.shutdown(wait=True, cancel_futures=True)